@@ -3,11 +3,12 @@ from __future__ import annotations
 
 import io
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
-from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+from functools import lru_cache
 
+import numpy as np
 import pandas as pd
-from sqlalchemy import Engine, text
+from sqlalchemy import Engine, RowMapping, bindparam, event, text
 
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
@@ -16,14 +17,31 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from pathlib import Path
 
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+try:
+    from numba import njit
+except ImportError:  # optional: seat filling falls back to plain Python
+    njit = None
+
+from matplotlib.artist import setp
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 
 PROGRAMS = ["PM", "IVT", "ITSS", "IB"]
 SEATS = {"PM": 40, "IVT": 50, "ITSS": 30, "IB": 20}
 
+# CSV columns (spec order) and the narrowest dtypes that hold them
+CSV_DTYPES = {
+    "id": "int64",
+    "consent": "int8",
+    "priority": "int8",
+    "phys": "int16",
+    "rus": "int16",
+    "math": "int16",
+    "indiv": "int16",
+    "total": "int32",
+}
+
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS applicants (
   id INTEGER PRIMARY KEY,
@@ -51,32 +69,116 @@ CREATE TABLE IF NOT EXISTS applications (
   PRIMARY KEY(day, program, applicant_id),
   FOREIGN KEY(applicant_id) REFERENCES applicants(id)
 );
-CREATE INDEX IF NOT EXISTS idx_applications_day_program ON applications(day, program);
 CREATE INDEX IF NOT EXISTS idx_applications_applicant ON applications(applicant_id);
+
+-- admission per day, materialized on upload: rank is the fill order within a program,
+-- version is the MAX(loads.id) the rows were computed from (stale versions are ignored)
+CREATE TABLE IF NOT EXISTS admission_results (
+  day TEXT NOT NULL,
+  version INTEGER NOT NULL,
+  program TEXT NOT NULL,
+  applicant_id INTEGER NOT NULL,
+  rank INTEGER NOT NULL,
+  total INTEGER NOT NULL,
+  PRIMARY KEY(day, version, program, rank)
+);
+
+-- covering indexes: hot reads never touch the table rows
+DROP INDEX IF EXISTS idx_applications_day_program;
+CREATE INDEX IF NOT EXISTS idx_applications_cover ON applications(day, program, applicant_id, consent, priority);
+CREATE INDEX IF NOT EXISTS idx_applicants_total ON applicants(id, total);
 """
 
+UPSERT_APPLICANT_SQL = """
+INSERT INTO applicants(id, phys, rus, math, indiv, total)
+VALUES (:id,:ph,:ru,:ma,:in,:to)
+ON CONFLICT(id) DO UPDATE SET
+  phys=excluded.phys, rus=excluded.rus, math=excluded.math, indiv=excluded.indiv, total=excluded.total
+"""
+
+UPSERT_APPLICATION_SQL = """
+INSERT INTO applications(day, program, applicant_id, consent, priority, loaded_at)
+VALUES (:d,:p,:id,:c,:pr,:t)
+ON CONFLICT(day, program, applicant_id) DO UPDATE SET
+  consent=excluded.consent,
+  priority=excluded.priority,
+  loaded_at=excluded.loaded_at
+"""
+
+# WAL + NORMAL: one fsync per checkpoint instead of per commit
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
+# lists longer than this go through a temp table instead of one bind per id
+# (999 is the lowest SQLITE_MAX_VARIABLE_NUMBER still found in the wild)
+MAX_INLINE_IDS = 900
+
+DELETE_ABSENT_SQL = text(
+    "DELETE FROM applications WHERE day=:d AND program=:p AND applicant_id NOT IN :ids"
+).bindparams(bindparam("ids", expanding=True))
+
+
+def tune_sqlite(engine: Engine) -> None:
+    """
+    Applies SQLITE_PRAGMAS to every new DBAPI connection of the engine
+    (synchronous, cache and mmap settings are per-connection in SQLite).
+    """
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_con, _record):
+        cur = dbapi_con.cursor()
+        for pragma in SQLITE_PRAGMAS:
+            cur.execute(pragma)
+        cur.close()
+
 
 def init_db(engine: Engine) -> None:
     with engine.begin() as con:
+        # journal mode is stored in the DB file, so it sticks even for untuned engines
+        con.execute(text("PRAGMA journal_mode=WAL"))
+        # admission_results is a derived cache: a layout without `version` is just rebuilt
+        cols = {r[1] for r in con.execute(text("PRAGMA table_info(admission_results)"))}
+        if cols and "version" not in cols:
+            con.execute(text("DROP TABLE admission_results"))
         for stmt in SCHEMA_SQL.strip().split(";"):
             s = stmt.strip()
             if s:
                 con.execute(text(s))
 
 
+def read_competition_csv(src) -> pd.DataFrame:
+    """
+    Typed CSV read: skips dtype sniffing and unused columns.
+    consent is parsed as bool so both True/False and 1/0 files load.
+    Integers are read as int64; _normalize_df range-checks and narrows them.
+    """
+    return pd.read_csv(
+        src,
+        usecols=lambda c: c in CSV_DTYPES,
+        dtype={**{c: "int64" for c in CSV_DTYPES}, "consent": "bool"},
+        engine="c",
+    )
+
+
 def _normalize_df(df: pd.DataFrame) -> pd.DataFrame:
-    required = ["id", "consent", "priority", "phys", "rus", "math", "indiv", "total"]
+    required = list(CSV_DTYPES)
     missing = [c for c in required if c not in df.columns]
     if missing:
         raise ValueError(f"CSV missing columns: {missing}")
 
-    out = df[required].copy()
-    out["id"] = out["id"].astype(int)
-    out["consent"] = out["consent"].astype(int)
-    out["priority"] = out["priority"].astype(int)
-    for c in ["phys", "rus", "math", "indiv", "total"]:
-        out[c] = out[c].astype(int)
-    return out
+    # astype wraps out-of-range integers silently, so reject them first
+    out = df[required]
+    lo, hi = out.min(), out.max()
+    bad = [c for c, dt in CSV_DTYPES.items() if lo[c] < np.iinfo(dt).min or hi[c] > np.iinfo(dt).max]
+    if bad:
+        raise ValueError(f"CSV values out of range in columns: {bad}")
+
+    return out.astype(CSV_DTYPES)
 
 
 def upsert_competition_list(engine: Engine, day: str, program: str, df: pd.DataFrame) -> None:
@@ -96,75 +198,50 @@ def upsert_competition_list(engine: Engine, day: str, program: str, df: pd.DataF
         )
 
         # upsert applicants (scores)
-        for _, r in df.iterrows():
-            con.execute(
-                text(
-                    """
-                INSERT INTO applicants(id, phys, rus, math, indiv, total)
-                VALUES (:id,:ph,:ru,:ma,:in,:to)
-                ON CONFLICT(id) DO UPDATE SET
-                  phys=excluded.phys, rus=excluded.rus, math=excluded.math, indiv=excluded.indiv, total=excluded.total
-            """
-                ),
-                {
-                    "id": int(r.id),
-                    "ph": int(r.phys),
-                    "ru": int(r.rus),
-                    "ma": int(r.math),
-                    "in": int(r.indiv),
-                    "to": int(r.total),
-                },
-            )
-
-        # old ids for this (day, program)
-        old_ids = set(
-            x[0]
-            for x in con.execute(
-                text("SELECT applicant_id FROM applications WHERE day=:d AND program=:p"),
-                {"d": day, "p": program},
-            ).fetchall()
+        applicant_params = (
+            df[["id", "phys", "rus", "math", "indiv", "total"]]
+            .rename(columns={"phys": "ph", "rus": "ru", "math": "ma", "indiv": "in", "total": "to"})
+            .to_dict("records")
         )
-        new_ids = set(df["id"].tolist())
-
-        # delete absent
-        to_delete = old_ids - new_ids
-        if to_delete:
+        if applicant_params:
+            con.execute(text(UPSERT_APPLICANT_SQL), applicant_params)
+
+        # delete absent; the set difference runs inside SQLite
+        new_ids = df["id"].tolist()
+        if len(new_ids) <= MAX_INLINE_IDS:
+            con.execute(DELETE_ABSENT_SQL, {"d": day, "p": program, "ids": new_ids})
+        else:
+            con.execute(text("CREATE TEMP TABLE IF NOT EXISTS new_ids(id INTEGER PRIMARY KEY)"))
+            con.execute(text("INSERT OR IGNORE INTO new_ids(id) VALUES (:id)"), [{"id": i} for i in new_ids])
             con.execute(
                 text(
-                    f"""
-                DELETE FROM applications
-                WHERE day=:d AND program=:p AND applicant_id IN ({",".join(str(i) for i in to_delete)})
-            """
+                    "DELETE FROM applications WHERE day=:d AND program=:p "
+                    "AND applicant_id NOT IN (SELECT id FROM new_ids)"
                 ),
                 {"d": day, "p": program},
             )
+            con.execute(text("DROP TABLE new_ids"))
 
         # upsert applications
-        for _, r in df.iterrows():
-            con.execute(
-                text(
-                    """
-                INSERT INTO applications(day, program, applicant_id, consent, priority, loaded_at)
-                VALUES (:d,:p,:id,:c,:pr,:t)
-                ON CONFLICT(day, program, applicant_id) DO UPDATE SET
-                    consent=excluded.consent,
-                    priority=excluded.priority,
-                    loaded_at=excluded.loaded_at
-            """
-                ),
-                {"d": day, "p": program, "id": int(r.id), "c": int(r.consent), "pr": int(r.priority), "t": now},
-            )
+        application_params = [
+            {"d": day, "p": program, "id": i, "c": c, "pr": pr, "t": now}
+            for i, c, pr in zip(df["id"].tolist(), df["consent"].tolist(), df["priority"].tolist())
+        ]
+        if application_params:
+            con.execute(text(UPSERT_APPLICATION_SQL), application_params)
 
+        # totals are shared across days, so any stored admission may be stale now;
+        # rematerialize this day, the rest is recomputed on first read
+        con.execute(text("DELETE FROM admission_results"))
+        _store_admission(con, day, _data_version(con), compute_admission(_admission_rows(con, day))[0])
 
-def query_program_list(
-    engine: Engine,
-    program: str,
-    day: Optional[str] = None,
-    consent: Optional[int] = None,
-    sort: str = "total_desc",
-) -> List[dict]:
+        # refresh planner stats so the covering indexes get picked
+        con.execute(text("ANALYZE"))
+
+
+def _program_list_filter(program: str, day: Optional[str], consent: Optional[int]) -> Tuple[str, dict]:
+    # FROM/WHERE shared by the list page and its row count
     q = """
-    SELECT a.applicant_id AS id, a.consent, a.priority, b.phys, b.rus, b.math, b.indiv, b.total
     FROM applications a
     JOIN applicants b ON b.id=a.applicant_id
     WHERE a.program=:p
@@ -176,6 +253,20 @@ def query_program_list(
     if consent in (0, 1):
         q += " AND a.consent=:c"
         params["c"] = consent
+    return q, params
+
+
+def query_program_list(
+    engine: Engine,
+    program: str,
+    day: Optional[str] = None,
+    consent: Optional[int] = None,
+    sort: str = "total_desc",
+    limit: Optional[int] = None,
+    offset: int = 0,
+) -> Sequence[RowMapping]:
+    where, params = _program_list_filter(program, day, consent)
+    q = "SELECT a.applicant_id AS id, a.consent, a.priority, b.phys, b.rus, b.math, b.indiv, b.total" + where
 
     if sort == "total_asc":
         q += " ORDER BY b.total ASC, b.id ASC"
@@ -184,43 +275,98 @@ def query_program_list(
     else:
         q += " ORDER BY b.total DESC, b.id ASC"
 
-    with engine.begin() as con:
-        rows = con.execute(text(q), params).mappings().all()
-    return [dict(r) for r in rows]
+    if limit is not None or offset:
+        # SQLite: a negative LIMIT means no limit, so offset works on its own too
+        q += " LIMIT :lim OFFSET :off"
+        params["lim"] = -1 if limit is None else limit
+        params["off"] = offset
 
+    with engine.connect() as con:
+        return con.execute(text(q), params).mappings().all()
 
-def query_all_applicants_with_cascade(engine: Engine, day: Optional[str] = None, limit: int = 2000) -> List[dict]:
+
+def count_program_list(
+    engine: Engine, program: str, day: Optional[str] = None, consent: Optional[int] = None
+) -> int:
+    where, params = _program_list_filter(program, day, consent)
+    with engine.connect() as con:
+        return con.execute(text("SELECT COUNT(*)" + where), params).scalar()
+
+
+def query_all_applicants_with_cascade(
+    engine: Engine, day: Optional[str] = None, limit: int = 2000
+) -> Sequence[RowMapping]:
+    # the inner ORDER BY feeds GROUP_CONCAT in priority order per applicant
     q = """
     SELECT a.applicant_id AS id, a.program, a.priority, a.consent, b.total
     FROM applications a
     JOIN applicants b ON b.id=a.applicant_id
     """
-    params = {}
+    params = {"lim": limit}
     if day:
         q += " WHERE a.day=:d"
         params["d"] = day
+    q += " ORDER BY a.applicant_id, a.priority"
+
+    q = f"""
+    SELECT id,
+           MAX(consent) AS any_consent,
+           MAX(total) AS max_total,
+           GROUP_CONCAT(program || ':' || priority, ', ') AS cascade
+    FROM ({q})
+    GROUP BY id
+    ORDER BY max_total DESC, id ASC
+    LIMIT :lim
+    """
 
-    with engine.begin() as con:
-        rows = con.execute(text(q), params).mappings().all()
+    with engine.connect() as con:
+        return con.execute(text(q), params).mappings().all()
 
-    per = defaultdict(list)
-    for r in rows:
-        per[int(r["id"])].append(r)
-
-    out = []
-    for aid, items in per.items():
-        items_sorted = sorted(items, key=lambda x: x["priority"])
-        cascade = ", ".join([f'{it["program"]}:{it["priority"]}' for it in items_sorted])
-        out.append(
-            {
-                "id": aid,
-                "any_consent": any(int(it["consent"]) == 1 for it in items),
-                "max_total": max(int(it["total"]) for it in items),
-                "cascade": cascade,
-            }
-        )
-    out.sort(key=lambda x: (-x["max_total"], x["id"]))
-    return out[:limit]
+
+def _fill_seats_py(order: np.ndarray, apps: List[np.ndarray]) -> Dict[str, List[int]]:
+    """
+    apps[k]: programs of applicant k in priority order.
+    Returns applicant indices taken by each program, in fill order.
+    Programs outside PROGRAMS are skipped, like code -1 in _fill_seats_csr.
+    """
+    taken = {p: [] for p in PROGRAMS}
+    free = sum(SEATS.values())
+
+    for k in order.tolist():
+        if not free:
+            break
+        for prog in apps[k]:
+            if prog in taken and len(taken[prog]) < SEATS[prog]:
+                taken[prog].append(k)
+                free -= 1
+                break
+    return taken
+
+
+def _fill_seats_csr(order, offsets, prog_codes, seats):
+    """
+    Same walk as _fill_seats_py over int arrays: programs of applicant k are
+    prog_codes[offsets[k]:offsets[k + 1]]. Returns (slots, counts) where
+    slots[p, :counts[p]] are the applicant indices taken by program p.
+    """
+    slots = np.empty((seats.shape[0], seats.max()), dtype=np.int64)
+    counts = np.zeros(seats.shape[0], dtype=np.int64)
+    free = seats.sum()
+
+    for k in order:
+        if free == 0:
+            break
+        for j in range(offsets[k], offsets[k + 1]):
+            p = prog_codes[j]
+            if p >= 0 and counts[p] < seats[p]:
+                slots[p, counts[p]] = k
+                counts[p] += 1
+                free -= 1
+                break
+    return slots, counts
+
+
+_fill_seats_kernel = njit(cache=True)(_fill_seats_csr) if njit is not None else None
 
 
 def compute_admission(rows: List[dict]) -> Tuple[Dict[str, List[int]], Dict[str, Optional[int]]]:
@@ -231,46 +377,138 @@ def compute_admission(rows: List[dict]) -> Tuple[Dict[str, List[int]], Dict[str,
     if df.empty:
         return {p: [] for p in PROGRAMS}, {p: None for p in PROGRAMS}
 
-    df = df[df["consent"] == 1].copy()
-    apps = defaultdict(list)
-    scores = {}
-
-    for _, r in df.iterrows():
-        aid = int(r["id"])
-        apps[aid].append((int(r["priority"]), r["program"]))
-        scores[aid] = int(r["total"])
-
-    for aid in list(apps.keys()):
-        apps[aid] = [p for _, p in sorted(apps[aid], key=lambda t: t[0])]
-
-    order = sorted(scores.keys(), key=lambda i: (-scores[i], i))
-    accepted = {p: [] for p in PROGRAMS}
-
-    for aid in order:
-        for prog in apps[aid]:
-            if len(accepted[prog]) < SEATS[prog]:
-                accepted[prog].append(aid)
-                break
+    df = df[df["consent"] == 1]
+    ids = df["id"].to_numpy()
+    # by applicant, then priority (lexsort: last key is primary)
+    rank = np.lexsort((df["priority"].to_numpy(), ids))
+    ids = ids[rank]
+    progs = df["program"].to_numpy()[rank]
+    tots = df["total"].to_numpy()[rank]
+
+    # one slice of programs per applicant, already in priority order
+    aids, starts = np.unique(ids, return_index=True)
+    scores = tots[starts]
+    order = np.lexsort((aids, -scores))
+
+    if _fill_seats_kernel is not None:
+        codes = pd.Categorical(progs, categories=PROGRAMS).codes
+        offsets = np.append(starts, len(ids))
+        seats = np.array([SEATS[p] for p in PROGRAMS], dtype=np.int64)
+        slots, counts = _fill_seats_kernel(order, offsets, codes, seats)
+        taken = {p: slots[j, : counts[j]] for j, p in enumerate(PROGRAMS)}
+    else:
+        taken = _fill_seats_py(order, np.split(progs, starts[1:]))
 
+    accepted = {p: aids[taken[p]].tolist() for p in PROGRAMS}
     cut = {}
     for p in PROGRAMS:
-        cut[p] = None if len(accepted[p]) < SEATS[p] else scores[accepted[p][-1]]
+        cut[p] = None if len(accepted[p]) < SEATS[p] else int(scores[taken[p][-1]])
     return accepted, cut
 
 
-def compute_admission_from_db(engine: Engine, day: str) -> Tuple[Dict[str, List[int]], Dict[str, Optional[int]]]:
+def _data_version(con) -> Optional[int]:
+    # every upload appends to `loads` (AUTOINCREMENT ids are never reused) and may
+    # rewrite shared applicant totals, so the newest load id versions all days at once
+    return con.execute(text("SELECT MAX(id) FROM loads")).scalar()
+
+
+def _admission_rows(con, day: str) -> List[dict]:
     q = """
     SELECT a.applicant_id AS id, a.program, a.priority, a.consent, b.total
     FROM applications a
     JOIN applicants b ON b.id=a.applicant_id
     WHERE a.day=:d
     """
+    return [dict(r) for r in con.execute(text(q), {"d": day}).mappings().all()]
+
+
+def _store_admission(con, day: str, version: Optional[int], accepted: Dict[str, List[int]]) -> None:
+    """
+    version must be read no later than the applications the admission was
+    computed from: a concurrent upload then leaves these rows behind its own
+    version instead of being overwritten by them.
+    """
+    if version is None:
+        return
+    con.execute(text("DELETE FROM admission_results WHERE day=:d AND version<:v"), {"d": day, "v": version})
+    params = [
+        {"d": day, "v": version, "p": p, "id": aid, "r": rank}
+        for p in PROGRAMS
+        for rank, aid in enumerate(accepted[p], start=1)
+    ]
+    if params:
+        con.execute(
+            text(
+                """
+            INSERT OR IGNORE INTO admission_results(day, version, program, applicant_id, rank, total)
+            SELECT :d, :v, :p, id, :r, total FROM applicants WHERE id=:id
+            """
+            ),
+            params,
+        )
+
+
+def _load_admission(
+    con, day: str, version: Optional[int]
+) -> Optional[Tuple[Dict[str, List[int]], Dict[str, Optional[int]]]]:
+    """
+    Reads the materialized admission for the day at this data version;
+    None if it isn't stored.
+    """
+    rows = con.execute(
+        text(
+            "SELECT program, applicant_id, total FROM admission_results "
+            "WHERE day=:d AND version=:v ORDER BY program, rank"
+        ),
+        {"d": day, "v": version},
+    ).fetchall()
+    if not rows:
+        return None
+
+    accepted = {p: [] for p in PROGRAMS}
+    last_total = {}
+    for prog, aid, total in rows:
+        if prog in accepted:
+            accepted[prog].append(aid)
+            last_total[prog] = total
+
+    cut = {}
+    for p in PROGRAMS:
+        cut[p] = None if len(accepted[p]) < SEATS[p] else last_total[p]
+    return accepted, cut
+
+
+@lru_cache(maxsize=256)
+def _compute_admission_cached(
+    engine: Engine, day: str, version: Optional[int]
+) -> Tuple[Dict[str, List[int]], Dict[str, Optional[int]]]:
+    # version was read by the caller before any application rows, see _store_admission
+    with engine.connect() as con:
+        stored = _load_admission(con, day, version)
+    if stored is not None:
+        return stored
+
+    # not materialized yet (or invalidated by an upload for another day)
     with engine.begin() as con:
-        rows = con.execute(text(q), {"d": day}).mappings().all()
-    return compute_admission([dict(r) for r in rows])
+        accepted, cut = compute_admission(_admission_rows(con, day))
+        _store_admission(con, day, version, accepted)
+    return accepted, cut
+
+
+def compute_admission_from_db(engine: Engine, day: str) -> Tuple[Dict[str, List[int]], Dict[str, Optional[int]]]:
+    with engine.connect() as con:
+        version = _data_version(con)
+    accepted, cut = _compute_admission_cached(engine, day, version)
+    # hand out copies so callers can't corrupt the cached result
+    return {p: list(lst) for p, lst in accepted.items()}, dict(cut)
 
 
-def _stats_for_day(engine: Engine, day: str):
+def _stats_for_day(
+    engine: Engine,
+    day: str,
+    accepted: Optional[Dict[str, List[int]]] = None,
+    cut: Optional[Dict[str, Optional[int]]] = None,
+):
     # applications counts by priority (1..4) per program
     q = """
     SELECT a.program, a.priority, COUNT(*) AS cnt
@@ -278,41 +516,31 @@ def _stats_for_day(engine: Engine, day: str):
     WHERE a.day=:d
     GROUP BY a.program, a.priority
     """
-    with engine.begin() as con:
+    with engine.connect() as con:
         appl = con.execute(text(q), {"d": day}).fetchall()
     appl_map = {(p, pr): cnt for p, pr, cnt in appl}
 
-    accepted, cut = compute_admission_from_db(engine, day)
+    if accepted is None or cut is None:
+        accepted, cut = compute_admission_from_db(engine, day)
 
     # accepted by priority
     q2 = """
-    SELECT a.program, a.priority, a.applicant_id, a.consent, b.total
+    SELECT a.program, a.priority, a.applicant_id
     FROM applications a
-    JOIN applicants b ON b.id=a.applicant_id
     WHERE a.day=:d AND a.consent=1
     """
-    with engine.begin() as con:
-        rows = con.execute(text(q2), {"d": day}).mappings().all()
+    with engine.connect() as con:
+        rows = con.execute(text(q2), {"d": day}).fetchall()
 
     accepted_pr_counts = {(p, pr): 0 for p in PROGRAMS for pr in (1, 2, 3, 4)}
 
-    df = pd.DataFrame(rows)
-    if not df.empty:
-        # normalize to compute_admission input format
-        recs = []
-        for r in df.to_dict("records"):
-            r["id"] = int(r.get("id", r.get("applicant_id")))
-            recs.append(r)
-
-        accepted_map, _ = compute_admission(recs)
-        accepted_set = {p: set(lst) for p, lst in accepted_map.items()}
-
-        for _, r in df.iterrows():
-            prog = r["program"]
-            aid = int(r["applicant_id"])
-            pr = int(r["priority"])
-            if aid in accepted_set[prog]:
-                accepted_pr_counts[(prog, pr)] += 1
+    df = pd.DataFrame(rows, columns=["program", "priority", "applicant_id"])
+    accepted_pairs = [(p, aid) for p, lst in accepted.items() for aid in lst]
+    if not df.empty and accepted_pairs:
+        is_acc = pd.MultiIndex.from_arrays([df["program"], df["applicant_id"]]).isin(accepted_pairs)
+        counts = df[is_acc].groupby(["program", "priority"]).size()
+        for (prog, pr), n in counts.items():
+            accepted_pr_counts[(prog, int(pr))] = int(n)
 
     return appl_map, accepted_pr_counts, accepted, cut
 
@@ -345,6 +573,29 @@ def _register_cyrillic_fonts() -> Tuple[str, str]:
     return "DejaVu", "DejaVu"
 
 
+@lru_cache(maxsize=32)
+def _render_cutoffs_png(key: Tuple[Tuple[str, Tuple[int, ...]], ...]) -> bytes:
+    """
+    key: ((day, (cutoff per program in PROGRAMS order, 0 = НЕДОБОР)), ...)
+    """
+    # bare Figure + Agg canvas: no pyplot global state to set up or tear down
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    xs = [d for d, _ in key]
+    for j, p in enumerate(PROGRAMS):
+        ax.plot(xs, [cuts[j] for _, cuts in key], marker="o", label=p)
+    setp(ax.get_xticklabels(), rotation=30, ha="right")
+    ax.set_ylabel("Проходной балл (0 = НЕДОБОР)")
+    ax.set_title("Динамика проходных баллов")
+    ax.legend()
+    fig.tight_layout()
+
+    img_buf = io.BytesIO()
+    fig.savefig(img_buf, format="png", dpi=160)
+    return img_buf.getvalue()
+
+
 def build_pdf_report(engine: Engine, day: str) -> bytes:
     """
     PDF with Cyrillic support (DejaVu).
@@ -353,8 +604,9 @@ def build_pdf_report(engine: Engine, day: str) -> bytes:
     font_regular, font_bold = _register_cyrillic_fonts()
 
     # For dynamics: collect all days present in DB (sorted)
-    with engine.begin() as con:
+    with engine.connect() as con:
         days = [r[0] for r in con.execute(text("SELECT DISTINCT day FROM applications ORDER BY day")).fetchall()]
+        version = _data_version(con)
 
     if day not in days:
         raise ValueError("No data for requested day in DB.")
@@ -362,10 +614,12 @@ def build_pdf_report(engine: Engine, day: str) -> bytes:
     # compute cutoffs for all days
     cutoffs_by_day = {}
     for d in days:
-        _, cut = compute_admission_from_db(engine, d)
-        cutoffs_by_day[d] = cut
+        accepted_d, cut_d = _compute_admission_cached(engine, d, version)
+        cutoffs_by_day[d] = cut_d
+        if d == day:
+            accepted, cut = accepted_d, cut_d
 
-    appl_map, accepted_pr_counts, accepted, cut = _stats_for_day(engine, day)
+    appl_map, accepted_pr_counts, accepted, cut = _stats_for_day(engine, day, accepted, cut)
 
     buf = io.BytesIO()
     c = canvas.Canvas(buf, pagesize=A4)
@@ -394,21 +648,8 @@ def build_pdf_report(engine: Engine, day: str) -> bytes:
     y -= 8
 
     # Plot dynamics
-    fig = plt.figure()
-    xs = days
-    for p in PROGRAMS:
-        ys = [cutoffs_by_day[d][p] if cutoffs_by_day[d][p] is not None else 0 for d in xs]
-        plt.plot(xs, ys, marker="o", label=p)
-    plt.xticks(rotation=30, ha="right")
-    plt.ylabel("Проходной балл (0 = НЕДОБОР)")
-    plt.title("Динамика проходных баллов")
-    plt.legend()
-    plt.tight_layout()
-
-    img_buf = io.BytesIO()
-    fig.savefig(img_buf, format="png", dpi=160)
-    plt.close(fig)
-    img_buf.seek(0)
+    chart_key = tuple((d, tuple(cutoffs_by_day[d][p] or 0 for p in PROGRAMS)) for d in days)
+    img_buf = io.BytesIO(_render_cutoffs_png(chart_key))
 
     from reportlab.lib.utils import ImageReader
     c.drawImage(ImageReader(img_buf), 40, y - 220, width=520, height=220, preserveAspectRatio=True, mask="auto")
@@ -419,8 +660,11 @@ def build_pdf_report(engine: Engine, day: str) -> bytes:
     c.drawString(40, y, "Списки зачисленных (ID и сумма баллов)")
     y -= 16
 
-    with engine.begin() as con:
-        totals = {r[0]: r[1] for r in con.execute(text("SELECT id,total FROM applicants")).fetchall()}
+    # only the accepted ids are printed: PK lookups instead of a full table scan
+    needed = [aid for p in PROGRAMS for aid in accepted[p]]
+    totals_q = text("SELECT id,total FROM applicants WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+    with engine.connect() as con:
+        totals = {r[0]: r[1] for r in con.execute(totals_q, {"ids": needed}).fetchall()}
 
     for p in PROGRAMS:
         c.setFont(font_bold, 10)
@@ -6,21 +6,31 @@ from pathlib import Path
 
 import pandas as pd
 from flask import (
-    Flask, render_template_string, request, send_file,
+    Flask, render_template, request, send_file,
     redirect, url_for, flash
 )
 from sqlalchemy import create_engine, text
 
 from admission_core import (
     PROGRAMS, SEATS,
-    init_db, upsert_competition_list,
-    query_program_list, query_all_applicants_with_cascade,
+    init_db, tune_sqlite, read_competition_csv, upsert_competition_list,
+    query_program_list, count_program_list, query_all_applicants_with_cascade,
     compute_admission_from_db, build_pdf_report
 )
 
 BASE_DIR = Path(__file__).resolve().parent
 DB_PATH = BASE_DIR / "admission.sqlite"
-ENGINE = create_engine(f"sqlite:///{DB_PATH}", future=True)
+ENGINE = create_engine(
+    f"sqlite:///{DB_PATH}",
+    future=True,
+    connect_args={"check_same_thread": False},
+    pool_size=8,
+    pool_pre_ping=False,
+)
+tune_sqlite(ENGINE)
+
+# rows per page on /list/<program>
+LIST_PAGE_SIZE = 500
 
 app = Flask(__name__)
 app.secret_key = "demo-secret-key"
@@ -202,8 +212,11 @@ TEMPLATE_LIST = """
           <button class="btn btn-primary" type="submit" style="width:100%;">Применить</button>
         </div>
       </form>
-      <div class="muted" style="margin-top:10px;">
-        Записей: <span class="badge badge-blue">{{rows|length}}</span>
+      <div class="muted" style="margin-top:10px; display:flex; gap:10px; align-items:center;">
+        <span>Записей: <span class="badge badge-blue">{{total}}</span>
+          {% if (offset or next_url) and rows_html %}(показаны {{offset + 1}}–{{offset + rows_html|length}}){% endif %}</span>
+        {% if prev_url %}<a class="btn btn-outline" href="{{prev_url}}">← предыдущие</a>{% endif %}
+        {% if next_url %}<a class="btn btn-outline" href="{{next_url}}">следующие →</a>{% endif %}
       </div>
     </div>
 
@@ -219,24 +232,7 @@ TEMPLATE_LIST = """
           <th>ИД</th>
           <th class="right">Сумма</th>
         </tr>
-        {% for r in rows %}
-          <tr>
-            <td>{{r["id"]}}</td>
-            <td>
-              {% if r["consent"] %}
-                <span class="badge badge-blue">да</span>
-              {% else %}
-                <span class="badge">нет</span>
-              {% endif %}
-            </td>
-            <td>{{r["priority"]}}</td>
-            <td class="right">{{r["phys"]}}</td>
-            <td class="right">{{r["rus"]}}</td>
-            <td class="right">{{r["math"]}}</td>
-            <td class="right">{{r["indiv"]}}</td>
-            <td class="right"><b>{{r["total"]}}</b></td>
-          </tr>
-        {% endfor %}
+        {% for h in rows_html %}{{ h|safe }}{% endfor %}
       </table>
     </div>
   </div>
@@ -366,6 +362,33 @@ TEMPLATE_CUTOFFS = """
 </html>
 """
 
+# compiled once at import; render_template_string would re-parse on every request
+TMPL_INDEX = app.jinja_env.from_string(TEMPLATE_INDEX)
+TMPL_LIST = app.jinja_env.from_string(TEMPLATE_LIST)
+TMPL_CASCADE = app.jinja_env.from_string(TEMPLATE_CASCADE)
+TMPL_CUTOFFS = app.jinja_env.from_string(TEMPLATE_CUTOFFS)
+
+
+CONSENT_BADGE_HTML = ('<span class="badge">нет</span>', '<span class="badge badge-blue">да</span>')
+
+
+def _list_rows_html(rows) -> list[str]:
+    """
+    Table rows for TEMPLATE_LIST built in one vectorized pass.
+    Every cell is cast to int first, so the markup is safe without autoescape.
+    """
+    if not rows:
+        return []
+    df = pd.DataFrame(rows)
+    cells = df[["id", "priority", "phys", "rus", "math", "indiv", "total"]].astype("int64").astype(str)
+    consent = df["consent"].astype(bool).map({False: CONSENT_BADGE_HTML[0], True: CONSENT_BADGE_HTML[1]})
+
+    html = "<tr><td>" + cells["id"] + "</td><td>" + consent + "</td><td>" + cells["priority"] + "</td>"
+    for c in ("phys", "rus", "math", "indiv"):
+        html += '<td class="right">' + cells[c] + "</td>"
+    html += '<td class="right"><b>' + cells["total"] + "</b></td></tr>"
+    return html.tolist()
+
 
 # -----------------------------
 # Routes
@@ -382,6 +405,7 @@ def init():
 def clear():
     init_db(ENGINE)
     with ENGINE.begin() as con:
+        con.execute(text("DELETE FROM admission_results"))
         con.execute(text("DELETE FROM applications"))
         con.execute(text("DELETE FROM applicants"))
         con.execute(text("DELETE FROM loads"))
@@ -391,7 +415,7 @@ def clear():
 
 @app.get("/")
 def index():
-    return render_template_string(TEMPLATE_INDEX, programs=PROGRAMS)
+    return render_template(TMPL_INDEX, programs=PROGRAMS)
 
 
 @app.post("/upload")
@@ -404,7 +428,7 @@ def upload():
         flash("Не заполнены поля.")
         return redirect(url_for("index"))
 
-    df = pd.read_csv(f)
+    df = read_competition_csv(f)
     upsert_competition_list(ENGINE, day, program, df)
     flash(f"Загружено: {program} на {day}.")
     return redirect(url_for("index"))
@@ -420,15 +444,28 @@ def list_program(program: str):
         consent = int(consent_raw)
 
     sort = request.args.get("sort", "total_desc")
-    rows = query_program_list(ENGINE, program, day=day, consent=consent, sort=sort)
-
-    return render_template_string(
-        TEMPLATE_LIST,
+    limit = max(1, request.args.get("limit", LIST_PAGE_SIZE, type=int))
+    offset = max(0, request.args.get("offset", 0, type=int))
+    rows = query_program_list(ENGINE, program, day=day, consent=consent, sort=sort, limit=limit, offset=offset)
+    total = count_program_list(ENGINE, program, day=day, consent=consent)
+
+    def page_url(off: int) -> str:
+        return url_for(
+            "list_program", program=program, day=day, consent=consent, sort=sort,
+            limit=None if limit == LIST_PAGE_SIZE else limit, offset=off or None
+        )
+
+    return render_template(
+        TMPL_LIST,
         program=program,
         day=day,
         consent=consent,
         sort=sort,
-        rows=rows
+        rows_html=_list_rows_html(rows),
+        total=total,
+        offset=offset,
+        prev_url=page_url(max(0, offset - limit)) if offset else None,
+        next_url=page_url(offset + limit) if offset + limit < total else None
     )
 
 
@@ -436,7 +473,7 @@ def list_program(program: str):
 def cascade():
     day = request.args.get("day") or None
     rows = query_all_applicants_with_cascade(ENGINE, day=day, limit=1000)
-    return render_template_string(TEMPLATE_CASCADE, day=day, rows=rows)
+    return render_template(TMPL_CASCADE, day=day, rows=rows)
 
 
 @app.get("/cutoffs")
@@ -445,8 +482,8 @@ def cutoffs():
     accepted, cut = compute_admission_from_db(ENGINE, day)
     accepted_counts = {p: len(accepted[p]) for p in PROGRAMS}
 
-    return render_template_string(
-        TEMPLATE_CUTOFFS,
+    return render_template(
+        TMPL_CUTOFFS,
         day=day,
         programs=PROGRAMS,
         seats=SEATS,
@@ -1,16 +1,29 @@
 
 from __future__ import annotations
 
-import random
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from itertools import combinations
+from types import MappingProxyType
 from collections import defaultdict
+from functools import lru_cache
+from typing import NamedTuple
 
 import numpy as np
 import pandas as pd
 
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pac
+    import pyarrow.csv as pacsv
+except ImportError:  # optional: CSVs are written with pandas.to_csv
+    pa = None
+
 PROGRAMS = ["PM","IVT","ITSS","IB"]
 
+# membership patterns are 4-bit masks: subset test is (a & ~b)==0, disjoint is (a & b)==0
+BIT = {"PM":1,"IVT":2,"ITSS":4,"IB":8}
+
 SEATS = {"PM":40,"IVT":50,"ITSS":30,"IB":20}
 
 days = ["2024-08-01","2024-08-02","2024-08-03","2024-08-04"]
@@ -34,97 +47,112 @@ triple_intersections = {
     "2024-08-04":{("PM","IVT","ITSS"):1020,("PM","IVT","IB"):1020,("IVT","ITSS","IB"):1000,("PM","ITSS","IB"):1040,("PM","IVT","ITSS","IB"):1000},
 }
 
+# non-empty patterns are 1..15 (bit j = PROGRAMS[j])
+N_PAT = 1 << len(PROGRAMS)
+
+def _mask(progs):
+    return sum(BIT[p] for p in progs)
+
+# Moebius inversion over the subset lattice: "exactly S" = sum over T >= S of (-1)^(|T|-|S|) * "at least T"
+MOBIUS = np.array([
+    [(-1)**(t.bit_count()-m.bit_count()) if m & t == m else 0 for t in range(1,N_PAT)]
+    for m in range(1,N_PAT)
+], dtype=np.int32)
+
+@lru_cache(maxsize=None)
 def exclusive_counts(day: str):
-    A,B,C,D = PROGRAMS
-    I={}
-    for x,y in combinations(PROGRAMS,2):
-        I[(x,y)] = pair_intersections[day].get((x,y), pair_intersections[day][(y,x)])
-    I[(A,B,C)] = triple_intersections[day][(A,B,C)]
-    I[(A,B,D)] = triple_intersections[day][(A,B,D)]
-    I[(B,C,D)] = triple_intersections[day][(B,C,D)]
-    I[(A,C,D)] = triple_intersections[day][(A,C,D)]
-    I[(A,B,C,D)] = triple_intersections[day][(A,B,C,D)]
-    only={}
-    only[frozenset(PROGRAMS)] = I[(A,B,C,D)]
-    only[frozenset([A,B,C])] = I[(A,B,C)] - only[frozenset(PROGRAMS)]
-    only[frozenset([A,B,D])] = I[(A,B,D)] - only[frozenset(PROGRAMS)]
-    only[frozenset([A,C,D])] = I[(A,C,D)] - only[frozenset(PROGRAMS)]
-    only[frozenset([B,C,D])] = I[(B,C,D)] - only[frozenset(PROGRAMS)]
-    only[frozenset([A,B])] = I[(A,B)] - I[(A,B,C)] - I[(A,B,D)] + I[(A,B,C,D)]
-    only[frozenset([A,C])] = I[(A,C)] - I[(A,B,C)] - I[(A,C,D)] + I[(A,B,C,D)]
-    only[frozenset([A,D])] = I[(A,D)] - I[(A,B,D)] - I[(A,C,D)] + I[(A,B,C,D)]
-    only[frozenset([B,C])] = I[(B,C)] - I[(A,B,C)] - I[(B,C,D)] + I[(A,B,C,D)]
-    only[frozenset([B,D])] = I[(B,D)] - I[(A,B,D)] - I[(B,C,D)] + I[(A,B,C,D)]
-    only[frozenset([C,D])] = I[(C,D)] - I[(A,C,D)] - I[(B,C,D)] + I[(A,B,C,D)]
+    """Applicants per exact membership pattern; cached, hence a read-only mapping."""
+    incl=np.zeros(N_PAT-1, dtype=np.int32)  # incl[m-1]: applicants in at least the programs of m
     for p in PROGRAMS:
-        tot = totals[day][p]
-        s = sum(c for pat,c in only.items() if p in pat and len(pat)>=2)
-        only[frozenset([p])] = tot - s
-    return only
+        incl[_mask([p])-1]=totals[day][p]
+    for combo,c in (*pair_intersections[day].items(), *triple_intersections[day].items()):
+        incl[_mask(combo)-1]=c
+    only=MOBIUS @ incl
+    return MappingProxyType({m: int(only[m-1]) for m in range(1,N_PAT)})
+
+# scan order for placing a reused id: smallest patterns first, ties by mask
+PAT_ORDER = np.array(sorted(range(1,N_PAT), key=lambda pat:(pat.bit_count(), pat)), dtype=np.int64)
+PAT_SIZE = np.array([pat.bit_count() for pat in PAT_ORDER], dtype=np.int64)
+
+def _assign_reused(reuse_ids, must_in, must_out, u, remaining, pat_order, pat_size):
+    """
+    Give each reused id the smallest pattern still in stock that contains
+    must_in[i] and avoids must_out[i]; u[i] in [0,1) picks among equal sizes.
+    Decrements remaining (indexed by mask) in place; ids with no compatible
+    pattern are dropped. Returns (id_out, pat_out).
+    """
+    n=reuse_ids.shape[0]; n_pat=pat_order.shape[0]
+    id_out=np.empty(n, dtype=np.int64)
+    pat_out=np.empty(n, dtype=np.int64)
+    k=0
+    for i in range(n):
+        mi=must_in[i]; mo=must_out[i]
+        j=0
+        while j<n_pat:
+            e=j; cnt=0
+            while e<n_pat and pat_size[e]==pat_size[j]:
+                pat=pat_order[e]
+                if (pat & mi)==mi and (pat & mo)==0 and remaining[pat]>0:
+                    cnt+=1
+                e+=1
+            if cnt>0:
+                pick=int(u[i]*cnt)
+                for t in range(j,e):
+                    pat=pat_order[t]
+                    if (pat & mi)==mi and (pat & mo)==0 and remaining[pat]>0:
+                        if pick==0:
+                            id_out[k]=reuse_ids[i]; pat_out[k]=pat
+                            remaining[pat]-=1; k+=1
+                            break
+                        pick-=1
+                break
+            j=e
+    return id_out[:k], pat_out[:k]
 
 def build_day_memberships(exclusive, reuse_ids=None, prev_membership=None, constraints=None, rng=None):
-    rng = rng or random.Random(0)
-    patterns = sorted(exclusive.keys(), key=lambda s:(-len(s), tuple(sorted(s))))
-    remaining = {pat: exclusive[pat] for pat in patterns}
-    id_to_pat = {}
-    reuse_ids=list(reuse_ids or [])
-    rng.shuffle(reuse_ids)
-    constraints = constraints or {i:(set(),set()) for i in reuse_ids}
-
-    def compatible(pat, must_in, must_out):
-        return must_in.issubset(pat) and pat.isdisjoint(must_out) and remaining[pat]>0
-
-    for i in reuse_ids:
-        must_in, must_out = constraints.get(i,(set(),set()))
-        opts=[pat for pat in patterns if compatible(pat,must_in,must_out)]
-        if not opts:
-            continue
-        opts_sorted=sorted(opts, key=lambda p:(len(p), rng.random()))
-        chosen=opts_sorted[0]
-        id_to_pat[i]=chosen
-        remaining[chosen]-=1
-
-    next_id=(max(reuse_ids)+1) if reuse_ids else 1
-    for pat in patterns:
-        while remaining[pat]>0:
-            while next_id in id_to_pat:
-                next_id+=1
-            id_to_pat[next_id]=pat
-            remaining[pat]-=1
-            next_id+=1
-    return id_to_pat
+    """constraints: (must_in, must_out) mask arrays aligned with reuse_ids."""
+    rng = rng or np.random.default_rng(0)
+    remaining=np.zeros(N_PAT, dtype=np.int32)
+    for pat,c in exclusive.items():
+        remaining[pat]=c
+    reuse_ids=np.asarray(reuse_ids if reuse_ids is not None else [], dtype=np.int64)
+    n=reuse_ids.size
+    if constraints is None:
+        must_in=must_out=np.zeros(n, dtype=np.int8)
+    else:
+        must_in,must_out=(np.asarray(c, dtype=np.int8) for c in constraints)
+    perm=rng.permutation(n)
+    id_out,pat_out=_assign_reused(reuse_ids[perm], must_in[perm], must_out[perm], rng.random(n),
+                                  remaining, PAT_ORDER, PAT_SIZE)
+
+    # fresh ids above every reused one take what is left, largest patterns first
+    next_id=int(reuse_ids.max())+1 if n else 1
+    fill=PAT_ORDER[::-1]
+    new_pats=np.repeat(fill, remaining[fill])
+    id_out=np.concatenate([id_out, np.arange(next_id, next_id+new_pats.size)])
+    pat_out=np.concatenate([pat_out, new_pats])
+    return dict(zip(id_out.tolist(), pat_out.tolist()))
 
 def generate_applicant_base(max_id: int, rng: np.random.Generator):
-    ability = rng.normal(loc=0.55, scale=0.18, size=max_id+1)
-    ability = np.clip(ability, 0, 1)
-    phys = (40 + ability*60 + rng.normal(0,5,size=max_id+1)).round().astype(int)
-    rus  = (45 + ability*55 + rng.normal(0,5,size=max_id+1)).round().astype(int)
-    math = (45 + ability*55 + rng.normal(0,5,size=max_id+1)).round().astype(int)
-    phys = np.clip(phys,0,100); rus=np.clip(rus,0,100); math=np.clip(math,0,100)
-    indiv = rng.integers(0,11,size=max_id+1)
-    total = phys+rus+math+indiv
-    return pd.DataFrame({"id":np.arange(max_id+1),"phys":phys,"rus":rus,"math":math,"indiv":indiv,"total":total,"ability":ability})
-
-def make_pref_funcs(scale_PM, scale_IB, scale_IVT, scale_ITSS):
-    return {
-        "PM": lambda a: scale_PM*(1+1.2*a),
-        "IB": lambda a: scale_IB*(1+0.8*a),
-        "IVT": lambda a: scale_IVT*(1+0.6*a),
-        "ITSS": lambda a: scale_ITSS*(1+0.3*a),
-    }
-
-def biased_order(subset, ability, rng, funcs):
-    weights={p:funcs[p](ability) for p in subset}
-    remaining=set(subset)
-    out=[]
-    while remaining:
-        ps=list(remaining)
-        ws=np.array([weights[p] for p in ps],float)
-        ws=ws/ws.sum()
-        choice=rng.choice(ps,p=ws)
-        out.append(choice)
-        remaining.remove(choice)
-    return out
+    n=max_id+1
+    ability = rng.normal(loc=0.55, scale=0.18, size=n)
+    np.clip(ability, 0, 1, out=ability)
+    # one scratch pair reused for all three subjects; scores <= 100 and total <= 310 fit int16
+    noise=np.empty(n); raw=np.empty(n)
+    scores={}
+    for name,lo,slope in (("phys",40,60),("rus",45,55),("math",45,55)):
+        rng.standard_normal(out=noise)
+        np.multiply(noise, 5.0, out=noise)
+        np.multiply(ability, slope, out=raw)
+        np.add(raw, lo, out=raw)
+        np.add(raw, noise, out=raw)
+        np.clip(raw, 0, 100, out=raw)
+        np.rint(raw, out=raw)
+        scores[name]=raw.astype(np.int16)
+    indiv = rng.integers(0,11,size=n).astype(np.int16)
+    total = np.add(scores["phys"], scores["rus"])
+    total += scores["math"]; total += indiv
+    return pd.DataFrame({"id":np.arange(n),**scores,"indiv":indiv,"total":total,"ability":ability})
 
 PARAMS = {
     "base":{"2024-08-01":0.05,"2024-08-02":0.32,"2024-08-03":0.30,"2024-08-04":0.52},
@@ -137,42 +165,118 @@ PARAMS = {
         "2024-08-03":{"PM":1.05,"IVT":1.05,"ITSS":0.65,"IB":0.55},
         "2024-08-04":{"PM":1.55,"IB":0.78,"IVT":0.92,"ITSS":0.55},
     },
-    "pref_weights":{
-        "2024-08-01":make_pref_funcs(1.0,0.9,0.85,0.8),
-        "2024-08-02":make_pref_funcs(0.95,1.6,0.8,1.0),
-        "2024-08-03":make_pref_funcs(1.05,0.92,0.90,0.78),
-        "2024-08-04":make_pref_funcs(1.6,0.9,0.88,0.55),
-    }
+    # [day, program, (scale, slope)] in days/PROGRAMS order: weight = scale*(1+slope*ability)
+    "pref_weights":np.array([
+        [(1.0,1.2),(0.85,0.6),(0.8,0.3),(0.9,0.8)],
+        [(0.95,1.2),(0.8,0.6),(1.0,0.3),(1.6,0.8)],
+        [(1.05,1.2),(0.90,0.6),(0.78,0.3),(0.92,0.8)],
+        [(1.6,1.2),(0.88,0.6),(0.55,0.3),(0.9,0.8)],
+    ]),
 }
 
-def make_day_rows(day, id_to_pat, base_df, rng, params):
-    rows=[]
-    for aid,pat in id_to_pat.items():
-        subset=list(pat)
-        ability=float(base_df.loc[aid,"ability"])
-        order=biased_order(subset, ability, rng, params["pref_weights"][day])
-        for prg in subset:
-            priority=order.index(prg)+1
-            p=params["base"][day]
-            p += params["top_bonus"]*(priority==1)
-            p += params["ability_bonus"][day]*ability
-            p *= params["program_mult"][day].get(prg,1.0)
-            if day=="2024-08-03" and prg in ("ITSS","IB"):
-                p *= (1 - 0.6*ability)
-            p=min(max(p,0),0.95)
-            consent = rng.random() < p
-            phys=int(base_df.loc[aid,"phys"]); rus=int(base_df.loc[aid,"rus"]); math=int(base_df.loc[aid,"math"])
-            indiv=int(np.clip(base_df.loc[aid,"indiv"] + int(round(rng.normal(0,1))),0,10))
-            drift=params["score_drift"][day]
-            total=int(np.clip(phys+rus+math+indiv + drift*15*ability + rng.normal(0,1),0,320))
-            rows.append([day,prg,aid,consent,priority,phys,rus,math,indiv,total])
-    return pd.DataFrame(rows, columns=["day","program","id","consent","priority","phys","rus","math","indiv","total"])
+class BaseCols(NamedTuple):
+    """Applicant base as plain arrays indexed by applicant id (ids are 0..max_id)."""
+    ability: np.ndarray
+    phys: np.ndarray
+    rus: np.ndarray
+    math: np.ndarray
+    indiv: np.ndarray
+
+def base_cols(base_df):
+    return BaseCols(*(base_df[c].to_numpy() for c in BaseCols._fields))
+
+def make_day_rows(day, id_to_pat, base, rng, params):
+    ids=np.fromiter(id_to_pat.keys(), dtype=np.int64, count=len(id_to_pat))
+    pats=np.fromiter(id_to_pat.values(), dtype=np.int64, count=len(id_to_pat))
+    # mask[i,j]: applicant ids[i] applies to PROGRAMS[j]
+    mask=(pats[:,None] & np.array([BIT[p] for p in PROGRAMS])) != 0
+    abil_all=base.ability[ids]
+
+    # Plackett-Luce preference order for the whole cohort in one shot (Gumbel trick):
+    # sorting log(w)+Gumbel noise draws programs without replacement with prob ~ w
+    scale,slope=params["pref_weights"][days.index(day)].T
+    W=scale*(1+slope*abil_all[:,None])
+    keys=np.where(mask, np.log(W) + rng.gumbel(size=W.shape), -np.inf)
+    order_idx=np.argsort(-keys, axis=1)
+    # invert the permutation: rank of each program (not-applied ones sort last)
+    prio_all=np.empty_like(order_idx)
+    np.put_along_axis(prio_all, order_idx, np.arange(1,len(PROGRAMS)+1)[None,:], axis=1)
+
+    # one row per (applicant, program), applicants in id_to_pat order
+    row_i,prog_idx=np.nonzero(mask)
+    n=row_i.size
+    priority=prio_all[row_i,prog_idx].astype(np.int8)
+    ability=abil_all[row_i]
+    # all per-row randomness for the day in two bulk draws
+    u_consent=rng.random(n)
+    z_indiv,z_total=rng.standard_normal((2,n))
+
+    mult=np.array([params["program_mult"][day].get(p,1.0) for p in PROGRAMS])
+    p=params["base"][day] + params["top_bonus"]*(priority==1) + params["ability_bonus"][day]*ability
+    p*=mult[prog_idx]
+    if day=="2024-08-03":
+        late=np.isin(prog_idx,[PROGRAMS.index("ITSS"),PROGRAMS.index("IB")])
+        p[late]*=1 - 0.6*ability[late]
+    np.clip(p,0,0.95,out=p)
+    consent=u_consent < p
+
+    aid=ids[row_i].astype(np.int32)
+    phys=base.phys[aid]; rus=base.rus[aid]; math=base.math[aid]
+    indiv=base.indiv[aid] + np.rint(z_indiv).astype(np.int16)
+    np.clip(indiv,0,10,out=indiv)
+    drift=params["score_drift"][day]
+    total=np.add(phys+rus+math+indiv, drift*15*ability)
+    total+=z_total
+    np.clip(total,0,320,out=total)
+    total=total.astype(np.int16)
+    # struct-of-arrays with final dtypes: pandas wraps the columns, no per-cell inference
+    return pd.DataFrame({
+        "day":day,"program":pd.Categorical.from_codes(prog_idx, categories=PROGRAMS),"id":aid,"consent":consent,"priority":priority,
+        "phys":phys,"rus":rus,"math":math,"indiv":indiv,"total":total,
+    })
+
+def write_day_csvs(df, day, out_dir):
+    # group rows by program once (stable, so each list keeps its row order),
+    # then write contiguous slices instead of four boolean-mask copies
+    codes=df["program"].cat.codes.to_numpy()  # int8, PROGRAMS order
+    by_prog=np.argsort(codes, kind="stable")
+    bounds=np.searchsorted(codes[by_prog], np.arange(len(PROGRAMS)+1))
+    df_out=df[["id","consent","priority","phys","rus","math","indiv","total"]].take(by_prog)
+    for j,p in enumerate(PROGRAMS):
+        part=df_out.iloc[bounds[j]:bounds[j+1]]
+        path=out_dir/f"{day}_({p}).csv"
+        if pa is None:
+            part.to_csv(path, index=False)
+        else:
+            write_csv_arrow(part, path)
+
+def write_csv_arrow(df, path):
+    tbl=pa.Table.from_pandas(df, preserve_index=False)
+    # same text as pandas.to_csv: True/False booleans, unquoted header
+    i=tbl.schema.get_field_index("consent")
+    tbl=tbl.set_column(i, "consent", pac.if_else(tbl["consent"], "True", "False"))
+    with open(path, "wb") as f:
+        f.write((",".join(tbl.column_names)+"\n").encode())
+        pacsv.write_csv(tbl, f, write_options=pacsv.WriteOptions(include_header=False, quoting_style="none"))
+
+_worker_base=None
+
+def _init_worker(base):
+    # the applicant base is shipped once per worker process, not once per day
+    global _worker_base
+    _worker_base=base
+
+def _day_worker(task):
+    day,id_to_pat,seed,out_dir=task
+    df=make_day_rows(day, id_to_pat, _worker_base, np.random.default_rng(seed), PARAMS)
+    write_day_csvs(df, day, out_dir)
 
 def main():
     out_dir = Path(__file__).resolve().parent / "data"
     out_dir.mkdir(exist_ok=True)
 
-    rng_members = random.Random(42)
+    rng_members = np.random.default_rng(41)  # own stream, independent of rng_drop
+    rng_drop = np.random.default_rng(42)
     day_members={}
     prev=None
     for idx,day in enumerate(days):
@@ -181,33 +285,36 @@ def main():
             id_to_pat = build_day_memberships(exc, rng=rng_members)
         else:
             reuse=list(prev.keys())
-            constraints={}
-            for p in PROGRAMS:
-                prev_set={i for i,pat in prev.items() if p in pat}
-                del_n = int(round(len(prev_set)*rng_members.uniform(0.05,0.10)))
-                del_ids=set(rng_members.sample(list(prev_set), del_n))
-                keep_ids=prev_set - del_ids
-                for i in del_ids:
-                    mi,mo=constraints.get(i,(set(),set()))
-                    mo.add(p)
-                    constraints[i]=(mi,mo)
-                for i in keep_ids:
-                    mi,mo=constraints.get(i,(set(),set()))
-                    mi.add(p)
-                    constraints[i]=(mi,mo)
+            prev_pats=np.fromiter(prev.values(), dtype=np.int64, count=len(prev))
+            # keep[i,j]/drop[i,j]: reuse[i] stays in / leaves PROGRAMS[j]
+            keep=np.zeros((len(reuse),len(PROGRAMS)), dtype=bool)
+            drop=np.zeros_like(keep)
+            for j,p in enumerate(PROGRAMS):
+                members=np.flatnonzero(prev_pats & BIT[p])
+                del_n = int(round(members.size*rng_drop.uniform(0.05,0.10)))
+                gone=rng_drop.choice(members, size=del_n, replace=False)
+                keep[members,j]=True
+                keep[gone,j]=False
+                drop[gone,j]=True
+            # little-endian bit j == BIT[PROGRAMS[j]]
+            must_in=np.packbits(keep, axis=1, bitorder="little")[:,0]
+            must_out=np.packbits(drop, axis=1, bitorder="little")[:,0]
+            constraints=(must_in, must_out)
             id_to_pat = build_day_memberships(exc, reuse_ids=reuse, prev_membership=prev, constraints=constraints, rng=rng_members)
         day_members[day]=id_to_pat
         prev=id_to_pat
 
     max_id=max(max(m.keys()) for m in day_members.values())
     rng=np.random.default_rng(5)
-    base_df=generate_applicant_base(max_id, rng)
+    base=base_cols(generate_applicant_base(max_id, rng))
 
-    for day in days:
-        df=make_day_rows(day, day_members[day], base_df, rng, PARAMS)
-        df_out=df[["id","consent","priority","phys","rus","math","indiv","total"]].copy()
-        for p in PROGRAMS:
-            df_out[df["program"]==p].to_csv(out_dir/f"{day}_({p}).csv", index=False)
+    # days are independent once memberships are fixed: one worker per day, each with its
+    # own child seed so the output doesn't depend on scheduling
+    seeds=np.random.SeedSequence(5).spawn(len(days))
+    tasks=[(day, day_members[day], seed, out_dir) for day,seed in zip(days,seeds)]
+    with ProcessPoolExecutor(max_workers=min(len(days), os.cpu_count() or 1),
+                             initializer=_init_worker, initargs=(base,)) as ex:
+        list(ex.map(_day_worker, tasks))
 
     print("Generated 16 CSV files in", out_dir)
 